@@ -52,6 +52,10 @@ class ConfigManager(Thread):
         self._callback = callback
         self._callback_pass_args = callback_pass_args
 
+        # Read config once and serve it from memory afterwards
+        self._cfg = dict()
+        self._read_cfg()
+
         self.start()
 
     def run(self) -> None:
@@ -69,7 +73,7 @@ class ConfigManager(Thread):
         if self._ignore:
             self._ignore = False
         else:
-            self._read_cfg()
+            self.reload()
 
             if callable(self._callback):
                 if self._callback_pass_args:
@@ -88,6 +92,11 @@ class ConfigManager(Thread):
             err = f"Can't read '{self._cfg_file}'"
             logging.error(f"{repr(e)} - {err}")
 
+    def reload(self):
+        """ Re-read the configuration file. Values are kept in memory
+         so this is only needed if the file changed on disk """
+        self._read_cfg()
+
     def _write_cfg(self):
         """ Write the JSON dictionary into the given configuration file """
 
@@ -103,9 +112,6 @@ class ConfigManager(Thread):
     def get(self, *keys):
         """ Return the value of the given key(s) from a configuration file """
 
-        if not self._cfg:
-            self._read_cfg()
-
         if not keys:
             return self._cfg
 
@@ -125,9 +131,6 @@ class ConfigManager(Thread):
         """ Set a new value for the given key(s) in the configuration file.
         Will also execute the callback method if there is one """
 
-        if not self._cfg:
-            self._read_cfg()
-
         if not keys:
             return
 
@@ -154,9 +157,6 @@ class ConfigManager(Thread):
         """ Remove given key(s) from the configuration file.
         Will also execute the callback method if there is one """
 
-        if not self._cfg:
-            self._read_cfg()
-
         if not keys:
             return
 
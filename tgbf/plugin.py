@@ -1,14 +1,17 @@
 import os
+import re
 import sqlite3
+import weakref
 import logging
-import inspect
 import threading
 import tgbf.constants as c
 import tgbf.emoji as emo
 
 from enum import Enum
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Dict, Tuple, Callable
+from typing import List, Dict, Set, FrozenSet, Tuple, Callable, Pattern
 from telegram import ChatAction, Chat, Update, Message
 from telegram.ext import CallbackContext, Handler
 from telegram.ext.jobqueue import Job
@@ -18,6 +21,68 @@ from datetime import datetime, timedelta
 from tgbf.web import EndpointAction
 
 
+# Content of resource files with key = path and value = (mtime, content)
+_RESOURCE_CACHE: Dict[str, Tuple[float, str]] = dict()
+
+# Open database connections of the current thread
+_DB_CONNECTIONS = threading.local()
+
+
+class _ThreadConnections:
+    """ Database connections of a single thread with key = database path.
+    Connections will be closed once the thread ends or at interpreter exit """
+
+    def __init__(self):
+        self.connections: Dict[str, sqlite3.Connection] = dict()
+        weakref.finalize(self, _close_db_connections, self.connections)
+
+
+def _close_db_connections(connections: Dict[str, sqlite3.Connection]):
+    """ Close the given database connections """
+
+    for con in connections.values():
+        try:
+            con.close()
+        except Exception as e:
+            logging.error(e)
+
+    connections.clear()
+
+
+def _db_connection(db_path, timeout, cached_statements) -> sqlite3.Connection:
+    """ Return database connection for the current thread. Connection
+    will be opened on first usage and kept open for reuse as long as
+    the thread is alive. Since the connection is reused, prepared
+    statements will be reused too via the statement cache of 'sqlite3' """
+
+    thread_connections = getattr(_DB_CONNECTIONS, "value", None)
+
+    if thread_connections is None:
+        thread_connections = _DB_CONNECTIONS.value = _ThreadConnections()
+
+    con = thread_connections.connections.get(db_path)
+
+    if con is None:
+        con = sqlite3.connect(
+            db_path,
+            timeout=timeout,
+            check_same_thread=False,
+            cached_statements=cached_statements)
+
+        thread_connections.connections[db_path] = con
+
+    return con
+
+
+@lru_cache(maxsize=128)
+def _placeholder_pattern(placeholders: Tuple[str, ...]) -> Pattern:
+    """ Return compiled regex that matches all given placeholders.
+    Longer placeholders come first so that they win over prefixes """
+
+    placeholders = sorted(placeholders, key=len, reverse=True)
+    return re.compile("|".join(map(re.escape, placeholders)))
+
+
 class Notify(Enum):
     INFO = 1
     WARNING = 2
@@ -26,24 +91,41 @@ class Notify(Enum):
 
 class TGBFPlugin:
 
+    # Thread pools shared by all plugins with key = pool name
+    _executors: Dict[str, ThreadPoolExecutor] = dict()
+    _executors_lock = threading.Lock()
+
     def __init__(self, tg_bot: TelegramBot):
         self._bot = tg_bot
 
         # Set class name as name of this plugin
         self._name = type(self).__name__.lower()
 
+        # Directories of this plugin
+        self._plg_path = os.path.join(c.DIR_SRC, c.DIR_PLG, self._name)
+        self._res_path = os.path.join(self._plg_path, c.DIR_RES)
+        self._cfg_path = os.path.join(self._plg_path, c.DIR_CFG)
+        self._dat_path = os.path.join(self._plg_path, c.DIR_DAT)
+
         # Access to global config
         self._global_config = self._bot.config
 
         # Access to plugin config
         self._config = self.get_cfg_manager()
 
+        # Admin IDs from plugin config
+        self._admin_ids_plugin: FrozenSet[int] = frozenset()
+        self._cache_admin_ids()
+
         # All bot handlers for this plugin
         self._handlers: List[Handler] = list()
 
         # All web endpoints for this plugin
         self._endpoints: Dict[str, EndpointAction] = dict()
 
+        # Tables known to exist as tuples of (database path, table name)
+        self._table_exists_cache: Set[Tuple[str, str]] = set()
+
     def __enter__(self):
         """ This method gets executed after __init__() but before
         load(). Make sure to return 'self' if you override it """
@@ -61,9 +143,7 @@ class TGBFPlugin:
          It will not be executed if the configuration file of the
          plugin has the 'active = false' entry """
 
-        method = inspect.currentframe().f_code.co_name
-        msg = f"Method '{method}' of plugin '{self.name}' not implemented"
-        logging.warning(msg)
+        logging.warning("Method 'load' of plugin '%s' not implemented", self.name)
 
     def cleanup(self):
         """ Overwrite this method if you want to clean something up
@@ -94,7 +174,12 @@ class TGBFPlugin:
             cfg_file = f"{self.name}.json"
             cfg_fold = os.path.join(self.get_cfg_path())
 
-            on_change = on_change if on_change else self.callback_cfg_change
+            callback = on_change if on_change else self.callback_cfg_change
+
+            def on_change(*args):
+                # Keep cached admin IDs in sync with the config file
+                self._cache_admin_ids()
+                return callback(*args)
 
         cfg_path = os.path.join(cfg_fold, cfg_file)
 
@@ -102,10 +187,13 @@ class TGBFPlugin:
         os.makedirs(cfg_fold, exist_ok=True)
 
         # Create config file if it doesn't exist
-        if not os.path.isfile(cfg_path):
-            with open(cfg_path, 'w') as file:
+        try:
+            fd = os.open(cfg_path, os.O_CREAT | os.O_WRONLY | os.O_EXCL, 0o644)
+            with os.fdopen(fd, 'w') as file:
                 # Make it a valid JSON file
                 file.write("{}")
+        except FileExistsError:
+            pass
 
         # Return plugin config
         return ConfigManager(
@@ -113,6 +201,22 @@ class TGBFPlugin:
             callback=on_change,
             callback_pass_args=pass_args)
 
+    def reload_config(self):
+        """ Re-read the plugin configuration file. Config values are
+         held in memory, so this is only needed after changes on disk
+         that haven't been picked up by the file watcher """
+        self.config.reload()
+        self._cache_admin_ids()
+
+    def _cache_admin_ids(self):
+        """ Read admin IDs from plugin config into a set """
+
+        admins_plugin = self.config.get("admins")
+        if admins_plugin and isinstance(admins_plugin, list):
+            self._admin_ids_plugin = frozenset(admins_plugin)
+        else:
+            self._admin_ids_plugin = frozenset()
+
     @property
     def bot(self) -> TelegramBot:
         return self._bot
@@ -169,24 +273,53 @@ class TGBFPlugin:
         value = EndpointAction for this plugin """
         return self._endpoints
 
-    def add_handler(self, handler: Handler, group: int = 0):
+    def add_handler(self, handler: Handler, group: int = 0, log: bool = True):
         """ Will add bot handlers to this plugins list of handlers
          and also add them to the bot dispatcher """
 
         self.bot.dispatcher.add_handler(handler, group)
         self.handlers.append(handler)
 
-        logging.info(f"Plugin '{self.name}': {type(handler).__name__} added")
+        if log:
+            logging.info("Plugin '%s': %s added", self.name, type(handler).__name__)
+
+    def add_handlers(self, handlers: List[Handler], group: int = 0):
+        """ Will add multiple bot handlers for the same group to this
+         plugins list of handlers and to the bot dispatcher at once """
+
+        if not handlers:
+            return
+
+        for handler in handlers:
+            self.add_handler(handler, group, log=False)
 
-    def add_endpoint(self, name, endpoint: EndpointAction):
+        names = ", ".join(type(handler).__name__ for handler in handlers)
+        logging.info("Plugin '%s': %s added", self.name, names)
+
+    def add_endpoint(self, name, endpoint: EndpointAction, log: bool = True):
         """ Will add web endpoints (Flask) to this plugins list of
-         endpoints and also add them to the Flask app """
+         endpoints and also add them to the Flask app. The name
+         of the endpoint will be returned """
 
         name = name if name.startswith("/") else "/" + name
         self.bot.web.app.add_url_rule(name, name, endpoint)
         self.endpoints[name] = endpoint
 
-        logging.info(f"Plugin '{self.name}': Endpoint '{name}' added")
+        if log:
+            logging.info("Plugin '%s': Endpoint '%s' added", self.name, name)
+
+        return name
+
+    def add_endpoints(self, endpoints: Dict[str, EndpointAction]):
+        """ Will add multiple web endpoints (Flask) with key = endpoint
+         name and value = EndpointAction to this plugins list of
+         endpoints and to the Flask app at once """
+
+        if not endpoints:
+            return
+
+        names = [f"'{self.add_endpoint(n, e, log=False)}'" for n, e in endpoints.items()]
+        logging.info("Plugin '%s': Endpoints %s added", self.name, ", ".join(names))
 
     # TODO: Remove
     def get_usage(self, replace: dict = None):
@@ -198,13 +331,11 @@ class TGBFPlugin:
         usage = self.get_resource(f"{self.name}.md")
 
         if usage:
-            usage = usage.replace("{{handle}}", self.handle)
+            values = {p: str(v) for p, v in replace.items()} if replace else dict()
+            values["{{handle}}"] = self.handle
 
-            if replace:
-                for placeholder, value in replace.items():
-                    usage = usage.replace(placeholder, str(value))
-
-            return usage
+            pattern = _placeholder_pattern(tuple(values))
+            return pattern.sub(lambda m: values[m.group(0)], usage)
 
         return None
 
@@ -224,11 +355,21 @@ class TGBFPlugin:
         return self._get_resource_content(path)
 
     def _get_resource_content(self, path):
-        """ Return the content of the file in the given path """
+        """ Return the content of the file in the given path. Content
+         is cached and only read again if the file has been modified """
 
         try:
+            mtime = os.stat(path).st_mtime
+
+            cached = _RESOURCE_CACHE.get(path)
+            if cached and cached[0] == mtime:
+                return cached[1]
+
             with open(path, "r", encoding="utf8") as f:
-                return f.read()
+                content = f.read()
+
+            _RESOURCE_CACHE[path] = (mtime, content)
+            return content
         except Exception as e:
             logging.error(e)
             self.notify(e)
@@ -236,13 +377,7 @@ class TGBFPlugin:
 
     def get_jobs(self, name=None) -> Tuple['Job', ...]:
         """ Return jobs with given name or all jobs if not name given """
-
-        if name:
-            # Get all jobs with given name
-            return self.bot.job_queue.get_jobs_by_name(name)
-        else:
-            # Return all jobs
-            return self.bot.job_queue.jobs()
+        return self.bot.job_queue.get_jobs_by_name(name) if name else self.jobs
 
     def run_repeating(self, callback, interval, first=0, context=None, name=None):
         """ Executes the provided callback function indefinitely.
@@ -337,7 +472,7 @@ class TGBFPlugin:
         return self._get_database_content(db_path, sql, *args)
 
     def _get_database_content(self, db_path, sql, *args):
-        """ Open database connection and execute SQL statement """
+        """ Execute SQL statement on database connection """
 
         res = {"success": None, "data": None}
 
@@ -347,9 +482,6 @@ class TGBFPlugin:
             res["success"] = False
             return res
 
-        timeout = self.global_config.get("database", "timeout")
-        db_timeout = timeout if timeout else 5
-
         try:
             # Create directory if it doesn't exist
             directory = os.path.dirname(db_path)
@@ -364,14 +496,20 @@ class TGBFPlugin:
         cur = None
 
         try:
-            con = sqlite3.connect(db_path, timeout=db_timeout)
+            con = self._get_connection(db_path)
             cur = con.cursor()
             cur.execute(sql, args)
-            con.commit()
+
+            # Only statements that modify data open a transaction
+            if con.in_transaction:
+                con.commit()
 
             res["data"] = cur.fetchall()
             res["success"] = True
         except Exception as e:
+            if con:
+                con.rollback()
+
             res["data"] = str(e)
             res["success"] = False
             logging.error(e)
@@ -379,11 +517,21 @@ class TGBFPlugin:
         finally:
             if cur:
                 cur.close()
-            if con:
-                con.close()
 
             return res
 
+    def _get_connection(self, db_path) -> sqlite3.Connection:
+        """ Return database connection for the current thread with
+        settings from the global config """
+
+        timeout = self.global_config.get("database", "timeout")
+        cached = self.global_config.get("database", "cached_statements")
+
+        return _db_connection(
+            db_path,
+            timeout if timeout else 5,
+            128 if cached is None else cached)
+
     def global_table_exists(self, table_name):
         """ Return TRUE if given table exists in global database, otherwise FALSE """
 
@@ -410,66 +558,73 @@ class TGBFPlugin:
         return self._database_table_exists(db_path, table_name)
 
     def _database_table_exists(self, db_path, table_name):
-        """ Open connection to database and check if given table exists """
+        """ Check if given table exists in given database """
+
+        # Tables only get created, never dropped, so a hit is permanent
+        if (db_path, table_name) in self._table_exists_cache:
+            return True
 
         if not Path(db_path).is_file():
             return False
 
-        con = sqlite3.connect(db_path)
-        cur = con.cursor()
+        cur = None
         exists = False
 
         statement = self.get_global_resource("table_exists.sql")
 
         try:
+            cur = self._get_connection(db_path).cursor()
+
             if cur.execute(statement, [table_name]).fetchone():
                 exists = True
         except Exception as e:
             logging.error(e)
             self.notify(e)
+        finally:
+            if cur:
+                cur.close()
+
+        if exists:
+            self._table_exists_cache.add((db_path, table_name))
 
-        con.close()
         return exists
 
     def get_res_path(self, plugin=None):
         """ Return path of resource directory for this plugin """
         if not plugin:
-            plugin = self.name
+            return self._res_path
         return os.path.join(c.DIR_SRC, c.DIR_PLG, plugin, c.DIR_RES)
 
     def get_cfg_path(self, plugin=None):
         """ Return path of configuration directory for this plugin """
         if not plugin:
-            plugin = self.name
+            return self._cfg_path
         return os.path.join(c.DIR_SRC, c.DIR_PLG, plugin, c.DIR_CFG)
 
     def get_dat_path(self, plugin=None):
         """ Return path of data directory for this plugin """
         if not plugin:
-            plugin = self.name
+            return self._dat_path
         return os.path.join(c.DIR_SRC, c.DIR_PLG, plugin, c.DIR_DAT)
 
     def get_plg_path(self, plugin=None):
         """ Return path of current plugin directory """
         if not plugin:
-            plugin = self.name
+            return self._plg_path
         return os.path.join(c.DIR_SRC, c.DIR_PLG, plugin)
 
     def plugin_available(self, plugin_name):
         """ Return TRUE if the given plugin is enabled or FALSE otherwise """
-        for plugin in self.plugins:
-            if plugin.name == plugin_name.lower():
-                return True
-        return False
+        return plugin_name.lower() in self.bot.plugin_names
 
     def is_private(self, message: Message):
         """ Check if message was sent in a private chat or not """
-        return self.bot.updater.bot.get_chat(message.chat_id).type == Chat.PRIVATE
+        return message.chat.type == Chat.PRIVATE
 
     def remove_msg(self, message: Message, after_secs, private=True, public=True):
         """ Remove a Telegram message after a given time """
 
-        is_private = self.bot.updater.bot.get_chat(message.chat_id).type == Chat.PRIVATE
+        is_private = message.chat.type == Chat.PRIVATE
 
         def remove_msg_job(context: CallbackContext):
             param_lst = str(context.job.context).split("_")
@@ -479,7 +634,7 @@ class TGBFPlugin:
             try:
                 context.bot.delete_message(chat_id=chat_id, message_id=msg_id)
             except Exception as e:
-                logging.error(f"Not possible to remove message: {e}")
+                logging.error("Not possible to remove message: %s", e)
 
         def remove():
             self.run_once(
@@ -492,29 +647,36 @@ class TGBFPlugin:
 
     def notify(self, some_input, style: Notify = Notify.ERROR):
         """ All admins in global config will get a message with the given text.
-         Primarily used for exceptions but can be used with other inputs too. """
+         Primarily used for exceptions but can be used with other inputs too.
+         Messages will be sent in the background via the 'notify' thread pool """
 
         if isinstance(some_input, Exception):
             some_input = repr(some_input)
 
-        if self.global_config.get("admin", "notify_on_error"):
-            for admin in self.global_config.get("admin", "ids"):
-                if style == Notify.INFO:
-                    emoji = f"{emo.INFO}"
-                elif style == Notify.WARNING:
-                    emoji = f"{emo.WARNING}"
-                elif style == Notify.ERROR:
-                    emoji = f"{emo.ALERT}"
-                else:
-                    emoji = f"{emo.ALERT}"
+        if not self.global_config.get("admin", "notify_on_error"):
+            return some_input
 
-                msg = f"{emoji} {some_input}"
+        if style == Notify.INFO:
+            emoji = f"{emo.INFO}"
+        elif style == Notify.WARNING:
+            emoji = f"{emo.WARNING}"
+        elif style == Notify.ERROR:
+            emoji = f"{emo.ALERT}"
+        else:
+            emoji = f"{emo.ALERT}"
+
+        msg = f"{emoji} {some_input}"
+
+        def send(admin_id):
+            try:
+                self.bot.updater.bot.send_message(admin_id, msg)
+            except Exception as e:
+                logging.error("Not possible to notify admin id '%s': %s", admin_id, e)
+
+        # Don't block the caller while messages are being sent
+        for admin in self.global_config.get("admin", "ids") or ():
+            self.executor("notify").submit(send, admin)
 
-                try:
-                    self.bot.updater.bot.send_message(admin, msg)
-                except Exception as e:
-                    error = f"Not possible to notify admin id '{admin}'"
-                    logging.error(f"{error}: {e}")
         return some_input
 
     @classmethod
@@ -524,7 +686,7 @@ class TGBFPlugin:
         def _private(self, update: Update, context: CallbackContext, **kwargs):
             if self.config.get("private") == False:
                 return func(self, update, context, **kwargs)
-            elif context.bot.get_chat(update.message.chat_id).type == Chat.PRIVATE:
+            elif update.effective_chat.type == Chat.PRIVATE:
                 return func(self, update, context, **kwargs)
             else:
                 try:
@@ -543,7 +705,7 @@ class TGBFPlugin:
         def _public(self, update: Update, context: CallbackContext, **kwargs):
             if self.config.get("public") == False:
                 return func(self, update, context, **kwargs)
-            elif context.bot.get_chat(update.message.chat_id).type != Chat.PRIVATE:
+            elif update.effective_chat.type != Chat.PRIVATE:
                 return func(self, update, context, **kwargs)
             else:
                 try:
@@ -570,15 +732,14 @@ class TGBFPlugin:
 
             user_id = update.effective_user.id
 
+            # Global admins can change at runtime, so don't cache them
             admins_global = self.global_config.get("admin", "ids")
             if admins_global and isinstance(admins_global, list):
                 if user_id in admins_global:
                     return func(self, update, context, **kwargs)
 
-            admins_plugin = self.config.get("admins")
-            if admins_plugin and isinstance(admins_plugin, list):
-                if user_id in admins_plugin:
-                    return func(self, update, context, **kwargs)
+            if user_id in self._admin_ids_plugin:
+                return func(self, update, context, **kwargs)
 
         return _owner
 
@@ -591,7 +752,7 @@ class TGBFPlugin:
             dependencies = self.config.get("dependencies")
 
             if dependencies and isinstance(dependencies, list):
-                plugin_names = [p.name for p in self.plugins]
+                plugin_names = self.bot.plugin_names
 
                 for dependency in dependencies:
                     if dependency.lower() not in plugin_names:
@@ -599,7 +760,7 @@ class TGBFPlugin:
                         update.message.reply_text(msg)
                         return
             else:
-                logging.error(f"Dependencies for plugin '{self.name}' not defined as list")
+                logging.error("Dependencies for plugin '%s' not defined as list", self.name)
 
             return func(self, update, context, **kwargs)
         return _dependency
@@ -613,7 +774,7 @@ class TGBFPlugin:
             elif update.callback_query:
                 user_id = update.callback_query.message.chat_id
             else:
-                logging.warning(f"Can not extract user ID - {update}")
+                logging.warning("Can not extract user ID - %s", update)
                 return func(self, update, context, **kwargs)
 
             try:
@@ -662,9 +823,41 @@ class TGBFPlugin:
 
         return _whitelist
 
-    @staticmethod
-    def threaded(fn):
-        """ Decorator for methods that have to run in their own thread """
+    @classmethod
+    def executor(cls, name="threaded") -> ThreadPoolExecutor:
+        """ Return the thread pool with the given name that is shared by
+        all plugins. It will be created on first usage. Pool 'threaded'
+        runs methods decorated with 'threaded' and pool 'notify' sends
+        admin notifications, so busy threaded methods can't delay them """
+
+        with cls._executors_lock:
+            executor = cls._executors.get(name)
+
+            if executor is None:
+                executor = cls._executors[name] = ThreadPoolExecutor(
+                    max_workers=(os.cpu_count() or 1) * 4,
+                    thread_name_prefix=f"{c.DIR_SRC}_{name}")
+
+        return executor
+
+    @classmethod
+    def threaded(cls, fn):
+        """ Decorator for methods that have to run in a separate thread.
+        The method will be executed in the shared thread pool and a
+        'Future' object for the result will be returned. Exceptions
+        raised by the method will be logged.
+
+        The pool has a limited number of workers, so methods that run
+        for a long time (endless loops) should use their own thread or
+        a job via 'run_repeating()' instead """
+
+        def _log_exception(future):
+            if not future.cancelled() and future.exception():
+                e = future.exception()
+                logging.error("Threaded method '%s' failed: %r", fn.__name__, e, exc_info=e)
+
         def _threaded(*args, **kwargs):
-            return threading.Thread(target=fn, args=args, kwargs=kwargs).start()
+            future = cls.executor().submit(fn, *args, **kwargs)
+            future.add_done_callback(_log_exception)
+            return future
         return _threaded
@@ -8,9 +8,8 @@ from telegram.ext import CallbackContext, CommandHandler
 class Feedback(TGBFPlugin):
 
     def load(self):
-        if not self.table_exists("feedback"):
-            sql = self.get_resource("create_feedback.sql")
-            self.execute_sql(sql)
+        sql = self.get_resource("create_feedback.sql")
+        self.execute_sql(sql)
 
         self.add_handler(CommandHandler(
             self.name,
@@ -32,7 +31,7 @@ class Feedback(TGBFPlugin):
         else:
             name = user.first_name
 
-        feedback = update.message.text.replace(f"/{self.handle} ", "")
+        feedback = update.message.text.split(maxsplit=1)[1]
         self.notify(f"Feedback from {name}: {feedback}")
 
         sql = self.get_resource("insert_feedback.sql")
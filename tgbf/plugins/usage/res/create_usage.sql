@@ -1,4 +1,4 @@
-CREATE TABLE usage (
+CREATE TABLE IF NOT EXISTS usage (
     user_id INTEGER NOT NULL,
     first_name TEXT NOT NULL,
     last_name TEXT,
@@ -1,6 +1,7 @@
 import logging
 
 from tgbf.plugin import TGBFPlugin
+from telegram import Chat
 from telegram.ext import MessageHandler, Filters
 from tgbf.web import EndpointAction
 
@@ -8,9 +9,8 @@ from tgbf.web import EndpointAction
 class Usage(TGBFPlugin):
 
     def load(self):
-        if not self.table_exists("usage"):
-            sql = self.get_resource("create_usage.sql")
-            self.execute_sql(sql)
+        sql = self.get_resource("create_usage.sql")
+        self.execute_sql(sql)
 
         # Capture all executed commands
         self.add_handler(MessageHandler(
@@ -25,12 +25,21 @@ class Usage(TGBFPlugin):
 
     def usage_callback(self, update, context):
         try:
-            chat = update.effective_chat
-            user = update.effective_user
+            message = update.message
 
-            if not chat or not user or not update.message:
-                msg = f"Could not save usage for update: {update}"
-                logging.warning(msg)
+            if not message or not message.from_user:
+                logging.warning("Could not save usage for update: %s", update)
+                return
+
+            chat = message.chat
+
+            # Only save usage for public chats
+            if chat.type == Chat.PRIVATE:
+                return
+
+            user = message.from_user
+
+            if user.is_bot:
                 return
 
             sql = self.get_resource("insert_usage.sql")
@@ -44,10 +53,10 @@ class Usage(TGBFPlugin):
                 chat.id,
                 chat.type,
                 chat.title,
-                update.message.text)
+                message.text)
         except Exception as e:
             msg = f"Could not save usage: {e}"
-            logging.error(f"{msg} - {update}")
+            logging.error("%s - %s", msg, update)
             self.notify(msg)
 
     def usage_web(self):
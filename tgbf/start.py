@@ -130,14 +130,12 @@ class TGBF:
         token_path = os.path.join(con.DIR_CFG, con.FILE_TKN)
 
         try:
-            if os.path.isfile(token_path):
-                with open(token_path, "r", encoding="utf8") as file:
-                    return json.load(file)["telegram"]
-            else:
-                exit(f"ERROR: No token file '{con.FILE_TKN}' found at '{token_path}'")
+            with open(token_path, "r", encoding="utf8") as file:
+                return json.load(file)["telegram"]
+        except FileNotFoundError:
+            exit(f"ERROR: No token file '{con.FILE_TKN}' found at '{token_path}'")
         except KeyError as e:
-            cls_name = f"Class: {type(self).__name__}"
-            logging.error(f"{repr(e)} - {cls_name}")
+            logging.error("%r - Class: %s", e, type(self).__name__)
             exit("ERROR: Can't read bot token")
 
     def start(self):
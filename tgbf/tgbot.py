@@ -64,6 +64,7 @@ class TelegramBot:
 
         # Load classes from folder 'plugins'
         self.plugins = list()
+        self.plugin_names = set()
         self._load_plugins()
 
         # Handler for file downloads (plugin updates)
@@ -127,6 +128,7 @@ class TelegramBot:
                     plugin.load()
 
                     self.plugins.append(plugin)
+                    self.plugin_names.add(plugin.name)
                     msg = f"Plugin '{plugin.name}' enabled"
                     logging.info(msg)
                     return True, msg
@@ -161,6 +163,7 @@ class TelegramBot:
 
                 # Remove plugin from list of all plugins
                 self.plugins.remove(plugin)
+                self.plugin_names.discard(plugin.name)
 
                 try:
                     # Run plugins cleanup method